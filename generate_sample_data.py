@@ -6,8 +6,72 @@ Generate sample lab report image for testing
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime, timedelta
 import random
+import functools
+import io
 import os
 
+FONT_PATH = "/System/Library/Fonts/Helvetica.ttc"
+ROW_HEIGHT = 25
+
+# Table layout: column x positions, headers and (for labs) text colour
+LAB_COLUMN_X = (50, 300, 450, 550, 700)
+LAB_HEADERS = ("TEST NAME", "RESULT", "UNITS", "REF RANGE", "FLAG")
+LAB_COLUMN_FILLS = ('black', 'black', 'black', 'black', 'red')
+VITAL_COLUMN_X = (50, 300, 450, 600)
+VITAL_HEADERS = ("PARAMETER", "VALUE", "UNITS", "TIME")
+
+# Lab Results Data: (test, value, unit, ref range, flag)
+LAB_DATA = [
+    ("Glucose", 95, "mg/dL", "70-100", ""),
+    ("Hemoglobin", 14.5, "g/dL", "13.5-17.5", ""),
+    ("White Blood Cells", 11.2, "K/uL", "4.5-11.0", "H"),
+    ("Platelets", 250, "K/uL", "150-400", ""),
+    ("Creatinine", 0.9, "mg/dL", "0.6-1.2", ""),
+    ("BUN", 18, "mg/dL", "7-20", ""),
+    ("Sodium", 140, "mEq/L", "136-145", ""),
+    ("Potassium", 4.2, "mEq/L", "3.5-5.0", ""),
+    ("ALT", 25, "U/L", "10-40", ""),
+    ("AST", 22, "U/L", "10-40", ""),
+]
+
+# Vital Signs Data: (parameter, value, unit, time)
+VITAL_DATA = [
+    ("Blood Pressure", "120/80", "mmHg", "09:15"),
+    ("Heart Rate", "72", "bpm", "09:15"),
+    ("Temperature", "98.6", "°F", "09:15"),
+    ("Respiratory Rate", "16", "breaths/min", "09:15"),
+    ("O2 Saturation", "98", "%", "09:15"),
+    ("Weight", "175", "lbs", "09:00"),
+    ("Height", "70", "inches", "09:00"),
+]
+
+# Column-wise copies of the tables, built once so each report only draws them
+LAB_COLUMNS = tuple(tuple(str(cell) for cell in column) for column in zip(*LAB_DATA))
+VITAL_COLUMNS = tuple(zip(*VITAL_DATA))
+
+
+@functools.lru_cache(maxsize=1)
+def _font_data():
+    """Read the font file once; every size is built from these bytes"""
+    with open(FONT_PATH, 'rb') as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=8)
+def load_font(size):
+    """Load the report font at the given size, falling back to Pillow's default"""
+    try:
+        return ImageFont.truetype(io.BytesIO(_font_data()), size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def draw_column(draw, position, cells, font, fill='black'):
+    """Draw a table column as one multiline block, one cell per row"""
+    # Pad the font's line height out to ROW_HEIGHT so columns stay aligned
+    spacing = ROW_HEIGHT - draw.textbbox((0, 0), "A", font=font)[3]
+    draw.multiline_text(position, "\n".join(cells), font=font, fill=fill, spacing=spacing)
+
 
 def generate_sample_lab_report():
     """Generate a sample lab report image"""
@@ -18,14 +82,9 @@ def generate_sample_lab_report():
     draw = ImageDraw.Draw(img)
     
     # Try to use a better font, fallback to default
-    try:
-        title_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 24)
-        header_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 18)
-        normal_font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 14)
-    except:
-        title_font = ImageFont.load_default()
-        header_font = ImageFont.load_default()
-        normal_font = ImageFont.load_default()
+    title_font = load_font(24)
+    header_font = load_font(18)
+    normal_font = load_font(14)
     
     # Header
     y_pos = 20
@@ -47,38 +106,17 @@ def generate_sample_lab_report():
     
     # Lab Results Header
     y_pos += 20
-    draw.text((50, y_pos), "TEST NAME", font=header_font, fill='black')
-    draw.text((300, y_pos), "RESULT", font=header_font, fill='black')
-    draw.text((450, y_pos), "UNITS", font=header_font, fill='black')
-    draw.text((550, y_pos), "REF RANGE", font=header_font, fill='black')
-    draw.text((700, y_pos), "FLAG", font=header_font, fill='black')
+    for x, header in zip(LAB_COLUMN_X, LAB_HEADERS):
+        draw.text((x, y_pos), header, font=header_font, fill='black')
     
     y_pos += 30
     draw.line([(50, y_pos), (width-50, y_pos)], fill='gray', width=1)
     
     # Lab Results Data
-    lab_data = [
-        ("Glucose", 95, "mg/dL", "70-100", ""),
-        ("Hemoglobin", 14.5, "g/dL", "13.5-17.5", ""),
-        ("White Blood Cells", 11.2, "K/uL", "4.5-11.0", "H"),
-        ("Platelets", 250, "K/uL", "150-400", ""),
-        ("Creatinine", 0.9, "mg/dL", "0.6-1.2", ""),
-        ("BUN", 18, "mg/dL", "7-20", ""),
-        ("Sodium", 140, "mEq/L", "136-145", ""),
-        ("Potassium", 4.2, "mEq/L", "3.5-5.0", ""),
-        ("ALT", 25, "U/L", "10-40", ""),
-        ("AST", 22, "U/L", "10-40", ""),
-    ]
-    
     y_pos += 20
-    for test, value, unit, ref_range, flag in lab_data:
-        draw.text((50, y_pos), test, font=normal_font, fill='black')
-        draw.text((300, y_pos), str(value), font=normal_font, fill='black')
-        draw.text((450, y_pos), unit, font=normal_font, fill='black')
-        draw.text((550, y_pos), ref_range, font=normal_font, fill='black')
-        if flag:
-            draw.text((700, y_pos), flag, font=normal_font, fill='red')
-        y_pos += 25
+    for x, cells, fill in zip(LAB_COLUMN_X, LAB_COLUMNS, LAB_COLUMN_FILLS):
+        draw_column(draw, (x, y_pos), cells, normal_font, fill=fill)
+    y_pos += ROW_HEIGHT * len(LAB_DATA)
     
     # Vital Signs Section
     y_pos += 40
@@ -87,32 +125,17 @@ def generate_sample_lab_report():
     draw.text((50, y_pos), "VITAL SIGNS", font=header_font, fill='black')
     
     y_pos += 30
-    draw.text((50, y_pos), "PARAMETER", font=header_font, fill='black')
-    draw.text((300, y_pos), "VALUE", font=header_font, fill='black')
-    draw.text((450, y_pos), "UNITS", font=header_font, fill='black')
-    draw.text((600, y_pos), "TIME", font=header_font, fill='black')
+    for x, header in zip(VITAL_COLUMN_X, VITAL_HEADERS):
+        draw.text((x, y_pos), header, font=header_font, fill='black')
     
     y_pos += 20
     draw.line([(50, y_pos), (width-50, y_pos)], fill='gray', width=1)
     
     # Vital Signs Data
-    vital_data = [
-        ("Blood Pressure", "120/80", "mmHg", "09:15"),
-        ("Heart Rate", "72", "bpm", "09:15"),
-        ("Temperature", "98.6", "°F", "09:15"),
-        ("Respiratory Rate", "16", "breaths/min", "09:15"),
-        ("O2 Saturation", "98", "%", "09:15"),
-        ("Weight", "175", "lbs", "09:00"),
-        ("Height", "70", "inches", "09:00"),
-    ]
-    
     y_pos += 20
-    for param, value, unit, time in vital_data:
-        draw.text((50, y_pos), param, font=normal_font, fill='black')
-        draw.text((300, y_pos), value, font=normal_font, fill='black')
-        draw.text((450, y_pos), unit, font=normal_font, fill='black')
-        draw.text((600, y_pos), time, font=normal_font, fill='black')
-        y_pos += 25
+    for x, cells in zip(VITAL_COLUMN_X, VITAL_COLUMNS):
+        draw_column(draw, (x, y_pos), cells, normal_font)
+    y_pos += ROW_HEIGHT * len(VITAL_DATA)
     
     # Save image
     output_path = "sample_data/sample_lab_report.png"
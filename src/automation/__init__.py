@@ -1,3 +1,4 @@
 from .form_filler import FormFiller
+from .async_form_filler import AsyncFormFiller
 
-__all__ = ["FormFiller"]
\ No newline at end of file
+__all__ = ["FormFiller", "AsyncFormFiller"]
\ No newline at end of file
@@ -0,0 +1,139 @@
+from playwright.async_api import async_playwright, Page, Browser, Playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from typing import Dict, Any, Optional, List
+import asyncio
+import logging
+from models.clinical_data import ClinicalDataExtraction
+from .form_filler import OPTIONAL_FIELD_TIMEOUT, _FILL_FIELDS_SCRIPT, _lab_result_fields, _vital_sign_fields
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFormFiller:
+    """Fills many EDC forms concurrently, one browser context per form"""
+    
+    def __init__(self, headless: bool = False, timeout: int = 30000, max_concurrency: int = 8):
+        self.headless = headless
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.browser: Optional[Browser] = None
+        self._playwright: Optional[Playwright] = None
+    
+    async def __aenter__(self):
+        await self.start_browser()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close_browser()
+    
+    async def start_browser(self):
+        """Initialize browser instance"""
+        self._playwright = await async_playwright().start()
+        self.browser = await self._playwright.chromium.launch(headless=self.headless)
+    
+    async def close_browser(self):
+        """Clean up browser resources"""
+        if self.browser:
+            await self.browser.close()
+            self.browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+    
+    async def fill_form_from_extraction_batch(self, extractions: List[ClinicalDataExtraction],
+                                             form_config: Dict[str, Any]) -> List[Optional[Exception]]:
+        """
+        Fill one form per extraction, at most max_concurrency at a time
+        
+        A "{index}" placeholder in screenshot_path is replaced with the
+        extraction's position so screenshots don't overwrite each other.
+        
+        Returns:
+            List with None for each form filled and the exception for each that failed
+        """
+        if not self.browser:
+            raise RuntimeError("Browser not initialized")
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def fill_one(index: int, extraction: ClinicalDataExtraction):
+            config = dict(form_config)
+            if "screenshot_path" in config:
+                config["screenshot_path"] = config["screenshot_path"].format(index=index)
+            async with semaphore:
+                await self.fill_form_from_extraction(extraction, config)
+        
+        results = await asyncio.gather(
+            *(fill_one(i, extraction) for i, extraction in enumerate(extractions)),
+            return_exceptions=True
+        )
+        return [result if isinstance(result, Exception) else None for result in results]
+    
+    async def fill_form_from_extraction(self, extraction: ClinicalDataExtraction, form_config: Dict[str, Any]):
+        """Fill entire form from extracted data in a fresh browser context"""
+        if not self.browser:
+            raise RuntimeError("Browser not initialized")
+        
+        context = await self.browser.new_context()
+        try:
+            page = await context.new_page()
+            page.set_default_timeout(self.timeout)
+            await self._fill_page(page, extraction, form_config)
+        except Exception as e:
+            logger.error(f"Error filling form: {e}")
+            raise
+        finally:
+            await context.close()
+    
+    async def _fill_page(self, page: Page, extraction: ClinicalDataExtraction, form_config: Dict[str, Any]):
+        """Fill an open page; mirrors FormFiller.fill_form_from_extraction"""
+        # Navigate to form
+        if "url" in form_config:
+            logger.info(f"Navigating to: {form_config['url']}")
+            await page.goto(form_config["url"], wait_until="domcontentloaded")
+        
+        # Wait for form to load
+        if "wait_selector" in form_config:
+            await page.wait_for_selector(form_config["wait_selector"])
+        else:
+            try:
+                await page.locator("form").first.wait_for(state="attached", timeout=5000)
+            except PlaywrightTimeoutError:
+                logger.warning("No <form> element found, filling page as loaded")
+        
+        # Fill lab results and vital signs
+        fields = []
+        if extraction.lab_results and "lab_fields" in form_config:
+            fields += _lab_result_fields(extraction.lab_results, form_config["lab_fields"])
+        if extraction.vital_signs and "vital_fields" in form_config:
+            fields += _vital_sign_fields(extraction.vital_signs, form_config["vital_fields"])
+        if fields:
+            result = await page.evaluate(_FILL_FIELDS_SCRIPT, fields)
+            logger.info(f"Filled {len(result['filled'])} of {len(fields)} fields")
+            if result["failed"]:
+                logger.warning(f"Invalid CSS selectors, skipped: {', '.join(result['failed'])}")
+        
+        # Handle blood pressure separately if needed
+        if extraction.blood_pressure and "blood_pressure_fields" in form_config:
+            bp_config = form_config["blood_pressure_fields"]
+            if "systolic" in bp_config:
+                await self._fill_if_present(page, bp_config["systolic"], str(extraction.blood_pressure.systolic))
+            if "diastolic" in bp_config:
+                await self._fill_if_present(page, bp_config["diastolic"], str(extraction.blood_pressure.diastolic))
+        
+        # Submit form if configured
+        if form_config.get("auto_submit", False) and "submit_button" in form_config:
+            await page.click(form_config["submit_button"])
+            logger.info("Form submitted")
+        
+        # Take screenshot for verification
+        if "screenshot_path" in form_config:
+            await page.screenshot(path=form_config["screenshot_path"])
+            logger.info(f"Screenshot saved to {form_config['screenshot_path']}")
+    
+    async def _fill_if_present(self, page: Page, selector: str, value: str):
+        """Fill a single field, giving up quickly if the form doesn't have it"""
+        try:
+            await page.fill(selector, value, timeout=OPTIONAL_FIELD_TIMEOUT)
+        except PlaywrightTimeoutError:
+            logger.warning(f"Field not found, skipped: {selector}")
\ No newline at end of file
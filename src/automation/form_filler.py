@@ -1,4 +1,5 @@
-from playwright.sync_api import sync_playwright, Page, Browser
+from playwright.sync_api import sync_playwright, Page, Browser, BrowserContext, Playwright
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from typing import Dict, Any, Optional, List
 import logging
 import time
@@ -6,15 +7,102 @@ from models.clinical_data import ClinicalDataExtraction, LabResult, VitalSign
 
 logger = logging.getLogger(__name__)
 
+# How long (ms) to wait for an optional field before skipping it
+OPTIONAL_FIELD_TIMEOUT = 500
+
+# Sets each field client-side and fires the events page.fill() would, so a
+# whole section is filled in one round-trip instead of one per field. Runs
+# through document.querySelector, so selectors must be plain CSS: Playwright
+# engines such as text=, xpath= or >> are reported as failed, not filled.
+# The value goes through the prototype's native setter so frameworks that
+# track input values (React) see the change.
+_FILL_FIELDS_SCRIPT = """
+(fields) => {
+    const filled = [];
+    const failed = [];
+    for (const field of fields) {
+        let element;
+        try {
+            element = document.querySelector(field.selector);
+        } catch (e) {
+            failed.push(field.selector);
+            continue;
+        }
+        if (!element) continue;
+        const descriptor = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(element), 'value');
+        if (descriptor && descriptor.set) {
+            descriptor.set.call(element, field.value);
+        } else {
+            element.value = field.value;
+        }
+        element.dispatchEvent(new Event('input', { bubbles: true }));
+        element.dispatchEvent(new Event('change', { bubbles: true }));
+        filled.push(field.selector);
+    }
+    return { filled, failed };
+}
+"""
+
+
+_FIELD_NAME_TRANSLATION = str.maketrans({" ": "_", "-": "_"})
+
+
+def _normalize_field_name(name: str) -> str:
+    """Normalize field names for mapping"""
+    return name.lower().translate(_FIELD_NAME_TRANSLATION)
+
+
+def _lab_result_fields(lab_results: List[LabResult], field_mapping: Dict[str, str]) -> List[Dict[str, str]]:
+    """Build the selector/value pairs for lab result fields"""
+    fields = []
+    for lab in lab_results:
+        # Map lab test name to field selector
+        field_key = _normalize_field_name(lab.test_name)
+        if field_key not in field_mapping:
+            continue
+        selector = field_mapping[field_key]
+        
+        fields.append({"selector": f"{selector}_value", "value": str(lab.value)})
+        fields.append({"selector": f"{selector}_unit", "value": lab.unit})
+        if lab.date_collected:
+            fields.append({"selector": f"{selector}_date", "value": lab.date_collected.strftime("%Y-%m-%d")})
+    return fields
+
+
+def _vital_sign_fields(vital_signs: List[VitalSign], field_mapping: Dict[str, str]) -> List[Dict[str, str]]:
+    """Build the selector/value pairs for vital sign fields"""
+    fields = []
+    for vital in vital_signs:
+        field_key = _normalize_field_name(vital.parameter)
+        if field_key not in field_mapping:
+            continue
+        selector = field_mapping[field_key]
+        
+        # Handle blood pressure specially
+        if vital.parameter == "blood_pressure" and "/" in str(vital.value):
+            systolic, diastolic = str(vital.value).split("/")
+            fields.append({"selector": f"{selector}_systolic", "value": systolic.strip()})
+            fields.append({"selector": f"{selector}_diastolic", "value": diastolic.strip()})
+        else:
+            fields.append({"selector": selector, "value": str(vital.value)})
+    return fields
+
 
 class FormFiller:
     """Automates web form filling for EDC systems"""
     
-    def __init__(self, headless: bool = False, timeout: int = 30000):
+    # Process-wide browser handed out by shared_browser()
+    _shared_playwright: Optional[Playwright] = None
+    _shared_browser: Optional[Browser] = None
+    
+    def __init__(self, headless: bool = False, timeout: int = 30000, browser: Optional[Browser] = None):
         self.headless = headless
         self.timeout = timeout
-        self.browser: Optional[Browser] = None
+        self.browser: Optional[Browser] = browser
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        self._playwright: Optional[Playwright] = None
+        self._owns_browser = browser is None
     
     def __enter__(self):
         self.start_browser()
@@ -23,19 +111,51 @@ class FormFiller:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close_browser()
     
+    @classmethod
+    def shared_browser(cls, headless: bool = False) -> Browser:
+        """
+        Return a browser shared by every FormFiller in this process
+        
+        Pass it as FormFiller(browser=...) so each form only opens a new
+        context instead of cold-starting Chromium. The first call decides
+        whether the browser is headless.
+        """
+        if FormFiller._shared_browser is None:
+            FormFiller._shared_playwright = sync_playwright().start()
+            FormFiller._shared_browser = FormFiller._shared_playwright.chromium.launch(headless=headless)
+        return FormFiller._shared_browser
+    
+    @classmethod
+    def close_shared_browser(cls):
+        """Shut down the browser created by shared_browser()"""
+        if FormFiller._shared_browser:
+            FormFiller._shared_browser.close()
+            FormFiller._shared_playwright.stop()
+            FormFiller._shared_browser = None
+            FormFiller._shared_playwright = None
+    
     def start_browser(self):
         """Initialize browser instance"""
-        playwright = sync_playwright().start()
-        self.browser = playwright.chromium.launch(headless=self.headless)
-        self.page = self.browser.new_page()
+        if self.browser is None:
+            self._playwright = sync_playwright().start()
+            self.browser = self._playwright.chromium.launch(headless=self.headless)
+        self.context = self.browser.new_context()
+        self.page = self.context.new_page()
         self.page.set_default_timeout(self.timeout)
     
     def close_browser(self):
         """Clean up browser resources"""
-        if self.page:
-            self.page.close()
-        if self.browser:
+        if self.context:
+            # Closing the context also closes its pages
+            self.context.close()
+            self.context = None
+            self.page = None
+        if self._owns_browser and self.browser:
             self.browser.close()
+            self.browser = None
+        if self._playwright:
+            self._playwright.stop()
+            self._playwright = None
     
     def navigate_to_form(self, url: str):
         """Navigate to EDC form URL"""
@@ -43,70 +163,45 @@ class FormFiller:
             raise RuntimeError("Browser not initialized")
         
         logger.info(f"Navigating to: {url}")
-        self.page.goto(url)
-        self.page.wait_for_load_state("networkidle")
+        # Don't wait for network idle: analytics beacons on EDC pages can hold
+        # it off for many seconds. Callers gate on the form element instead.
+        self.page.goto(url, wait_until="domcontentloaded")
     
     def fill_lab_results(self, lab_results: List[LabResult], field_mapping: Dict[str, str]):
         """Fill lab result fields"""
-        for lab in lab_results:
-            try:
-                # Map lab test name to field selector
-                field_key = self._normalize_field_name(lab.test_name)
-                if field_key in field_mapping:
-                    selector = field_mapping[field_key]
-                    
-                    # Fill value field
-                    value_selector = f"{selector}_value"
-                    if self.page.locator(value_selector).count() > 0:
-                        self.page.fill(value_selector, str(lab.value))
-                        logger.info(f"Filled {lab.test_name} value: {lab.value}")
-                    
-                    # Fill unit field if exists
-                    unit_selector = f"{selector}_unit"
-                    if self.page.locator(unit_selector).count() > 0:
-                        self.page.fill(unit_selector, lab.unit)
-                    
-                    # Fill date field if exists
-                    date_selector = f"{selector}_date"
-                    if lab.date_collected and self.page.locator(date_selector).count() > 0:
-                        date_str = lab.date_collected.strftime("%Y-%m-%d")
-                        self.page.fill(date_selector, date_str)
-                
-            except Exception as e:
-                logger.error(f"Error filling lab result {lab.test_name}: {e}")
+        self._fill_fields(_lab_result_fields(lab_results, field_mapping), "lab result")
     
     def fill_vital_signs(self, vital_signs: List[VitalSign], field_mapping: Dict[str, str]):
         """Fill vital sign fields"""
-        for vital in vital_signs:
-            try:
-                field_key = self._normalize_field_name(vital.parameter)
-                if field_key in field_mapping:
-                    selector = field_mapping[field_key]
-                    
-                    # Handle blood pressure specially
-                    if vital.parameter == "blood_pressure" and "/" in str(vital.value):
-                        systolic, diastolic = str(vital.value).split("/")
-                        
-                        # Fill systolic
-                        systolic_selector = f"{selector}_systolic"
-                        if self.page.locator(systolic_selector).count() > 0:
-                            self.page.fill(systolic_selector, systolic.strip())
-                        
-                        # Fill diastolic
-                        diastolic_selector = f"{selector}_diastolic"
-                        if self.page.locator(diastolic_selector).count() > 0:
-                            self.page.fill(diastolic_selector, diastolic.strip())
-                    else:
-                        # Fill standard vital sign
-                        if self.page.locator(selector).count() > 0:
-                            self.page.fill(selector, str(vital.value))
-                            logger.info(f"Filled {vital.parameter}: {vital.value}")
-                
-            except Exception as e:
-                logger.error(f"Error filling vital sign {vital.parameter}: {e}")
+        self._fill_fields(_vital_sign_fields(vital_signs, field_mapping), "vital sign")
+    
+    def _fill_fields(self, fields: List[Dict[str, str]], description: str):
+        """Fill all fields in a single page.evaluate() round-trip"""
+        if not fields:
+            return
+        
+        try:
+            result = self.page.evaluate(_FILL_FIELDS_SCRIPT, fields)
+            logger.info(f"Filled {len(result['filled'])} of {len(fields)} {description} fields")
+            if result["failed"]:
+                logger.warning(f"Invalid CSS selectors, skipped: {', '.join(result['failed'])}")
+        except Exception as e:
+            logger.error(f"Error filling {description} fields: {e}")
+    
+    def _fill_if_present(self, selector: str, value: str):
+        """Fill a single field, giving up quickly if the form doesn't have it"""
+        try:
+            self.page.fill(selector, value, timeout=OPTIONAL_FIELD_TIMEOUT)
+        except PlaywrightTimeoutError:
+            logger.warning(f"Field not found, skipped: {selector}")
     
     def fill_form_from_extraction(self, extraction: ClinicalDataExtraction, form_config: Dict[str, Any]):
-        """Fill entire form from extracted data"""
+        """
+        Fill entire form from extracted data
+        
+        Lab and vital sign selectors in form_config must be plain CSS; the
+        remaining selectors go through Playwright and may use its engines.
+        """
         try:
             # Navigate to form
             if "url" in form_config:
@@ -115,6 +210,11 @@ class FormFiller:
             # Wait for form to load
             if "wait_selector" in form_config:
                 self.page.wait_for_selector(form_config["wait_selector"])
+            else:
+                try:
+                    self.page.locator("form").first.wait_for(state="attached", timeout=5000)
+                except PlaywrightTimeoutError:
+                    logger.warning("No <form> element found, filling page as loaded")
             
             # Fill lab results
             if extraction.lab_results and "lab_fields" in form_config:
@@ -128,9 +228,9 @@ class FormFiller:
             if extraction.blood_pressure and "blood_pressure_fields" in form_config:
                 bp_config = form_config["blood_pressure_fields"]
                 if "systolic" in bp_config:
-                    self.page.fill(bp_config["systolic"], str(extraction.blood_pressure.systolic))
+                    self._fill_if_present(bp_config["systolic"], str(extraction.blood_pressure.systolic))
                 if "diastolic" in bp_config:
-                    self.page.fill(bp_config["diastolic"], str(extraction.blood_pressure.diastolic))
+                    self._fill_if_present(bp_config["diastolic"], str(extraction.blood_pressure.diastolic))
             
             # Submit form if configured
             if form_config.get("auto_submit", False) and "submit_button" in form_config:
@@ -144,8 +244,4 @@ class FormFiller:
             
         except Exception as e:
             logger.error(f"Error filling form: {e}")
-            raise
-    
-    def _normalize_field_name(self, name: str) -> str:
-        """Normalize field names for mapping"""
-        return name.lower().replace(" ", "_").replace("-", "_")
\ No newline at end of file
+            raise
\ No newline at end of file
@@ -1,6 +1,7 @@
 import base64
+import os
 from pathlib import Path
-from typing import Union, Optional, Tuple
+from typing import Union, Optional, Tuple, List
 from PIL import Image
 import PyPDF2
 import pdf2image
@@ -9,14 +10,20 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Poppler's default resolution; PDFs are never rendered finer than this
+PDF_MAX_DPI = 200
+# Most pdftocairo processes to split a multi-page PDF across
+PDF_THREAD_COUNT = min(4, os.cpu_count() or 1)
+
 
 class DocumentProcessor:
     """Handles various document formats and prepares them for AI processing"""
     
     SUPPORTED_FORMATS = {'.pdf', '.png', '.jpg', '.jpeg', '.tiff', '.bmp'}
+    MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png'}
     
-    def __init__(self):
-        self.max_image_size = (2048, 2048)  # Max size for AI processing
+    def __init__(self, max_image_size: Tuple[int, int] = (2048, 2048)):
+        self.max_image_size = max_image_size  # Max size for AI processing
     
     def process_document(self, file_path: Union[str, Path]) -> Tuple[str, str]:
         """
@@ -38,28 +45,73 @@ class DocumentProcessor:
         else:
             return self._process_image(file_path)
     
+    def process_document_pages(self, file_path: Union[str, Path]) -> List[Tuple[str, str]]:
+        """
+        Process every page of a document
+        
+        Returns:
+            List of (base64_image, format), one per PDF page; a single entry for images
+        """
+        file_path = Path(file_path)
+        
+        if file_path.suffix.lower() != '.pdf':
+            return [self.process_document(file_path)]
+        
+        if not file_path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        images = self._rasterize_pdf(file_path)
+        return [self._image_to_base64(image) for image in images]
+    
     def _process_pdf(self, pdf_path: Path) -> Tuple[str, str]:
         """Convert PDF to image and return base64"""
+        # Convert first page of PDF to image
+        images = self._rasterize_pdf(pdf_path, first_page=1, last_page=1)
+        return self._image_to_base64(images[0])
+    
+    def _rasterize_pdf(self, pdf_path: Path, first_page: Optional[int] = None,
+                       last_page: Optional[int] = None) -> List[Image.Image]:
+        """Render a page range (all pages by default) at the target size"""
         try:
-            # Convert first page of PDF to image
-            images = pdf2image.convert_from_path(pdf_path, first_page=1, last_page=1)
+            # Rasterizing straight at the target size lets pages skip the thumbnail resize.
+            # pdf2image splits the range across pdftocairo processes; one page uses one
+            images = pdf2image.convert_from_path(
+                pdf_path,
+                first_page=first_page,
+                last_page=last_page,
+                dpi=self._pdf_dpi(pdf_path),
+                thread_count=PDF_THREAD_COUNT,
+                use_pdftocairo=True
+            )
             if not images:
                 raise ValueError("Could not convert PDF to image")
             
-            # Process the first page
-            image = images[0]
-            return self._image_to_base64(image)
+            return images
         except Exception as e:
             logger.error(f"Error processing PDF: {e}")
             raise
     
+    def _pdf_dpi(self, pdf_path: Path) -> int:
+        """
+        Resolution that fits the page's long side within max_image_size
+        
+        Capped at PDF_MAX_DPI so small pages aren't upscaled. Based on the
+        first page; later pages of a different size fall back to the resize
+        in _image_to_base64.
+        """
+        # "612 x 792 pts (letter)"
+        page_size = pdf2image.pdfinfo_from_path(pdf_path)["Page size"].split()
+        long_side_pts = max(float(page_size[0]), float(page_size[2]))
+        return min(PDF_MAX_DPI, int(max(self.max_image_size) * 72 / long_side_pts))
+    
     def _process_image(self, image_path: Path) -> Tuple[str, str]:
         """Process image file and return base64"""
         try:
             image = Image.open(image_path)
             
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
+            # Convert to RGB if necessary. RGBA and L are left alone: _image_to_base64
+            # only converts them for JPEG output, after the resize has shrunk them
+            if image.mode not in ('RGB', 'RGBA', 'L'):
                 image = image.convert('RGB')
             
             return self._image_to_base64(image)
@@ -67,18 +119,30 @@ class DocumentProcessor:
             logger.error(f"Error processing image: {e}")
             raise
     
-    def _image_to_base64(self, image: Image.Image) -> Tuple[str, str]:
-        """Convert PIL Image to base64 string"""
+    def _image_to_base64(self, image: Image.Image, image_format: str = 'JPEG') -> Tuple[str, str]:
+        """
+        Convert PIL Image to base64 string
+        
+        JPEG is the default since the vision model doesn't need lossless input;
+        pass image_format='PNG' when the caller needs an exact copy.
+        """
         # Resize if too large
         if image.size[0] > self.max_image_size[0] or image.size[1] > self.max_image_size[1]:
             image.thumbnail(self.max_image_size, Image.Resampling.LANCZOS)
         
         # Convert to base64
         buffer = io.BytesIO()
-        image.save(buffer, format='PNG')
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(buffer, format='JPEG', quality=85, optimize=False, progressive=False)
+        else:
+            # Fast zlib level; the vision model doesn't benefit from tighter PNGs
+            image.save(buffer, format='PNG', compress_level=1)
+        # getbuffer() exposes the bytes without copying them out of the BytesIO
+        image_base64 = base64.b64encode(buffer.getbuffer()).decode('ascii')
         
-        return image_base64, 'image/png'
+        return image_base64, self.MIME_TYPES[image_format]
     
     def process_screenshot(self, screenshot_bytes: bytes) -> Tuple[str, str]:
         """Process screenshot bytes directly"""
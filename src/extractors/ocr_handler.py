@@ -3,19 +3,28 @@ from PIL import Image
 import cv2
 import numpy as np
 from typing import Optional
+import functools
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=1)
+def _tesseract_available() -> bool:
+    """Check for the tesseract binary once per process (the check spawns a subprocess)"""
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
 class OCRHandler:
     """Handles OCR processing for scanned documents"""
     
     def __init__(self):
         # Check if tesseract is installed
-        try:
-            pytesseract.get_tesseract_version()
-        except Exception:
+        if not _tesseract_available():
             logger.warning("Tesseract not found. OCR functionality will be limited.")
     
     def extract_text(self, image: Image.Image, preprocess: bool = True) -> str:
@@ -33,17 +42,12 @@ class OCRHandler:
     
     def _preprocess_image(self, image: Image.Image) -> Image.Image:
         """Preprocess image for better OCR results"""
-        # Convert PIL to OpenCV format
-        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply thresholding
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Convert straight to grayscale (no intermediate BGR copy)
+        gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
         
-        # Denoise
-        denoised = cv2.medianBlur(thresh, 3)
+        # Apply thresholding and denoise in place, reusing the grayscale buffer
+        cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=gray)
+        cv2.medianBlur(gray, 3, dst=gray)
         
         # Convert back to PIL
-        return Image.fromarray(denoised)
\ No newline at end of file
+        return Image.fromarray(gray)
\ No newline at end of file
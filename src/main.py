@@ -1,16 +1,17 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import os
+import re
+import hashlib
+import shutil
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 import json
-import pandas as pd
+import orjson
 import time
 from datetime import datetime
 
-from extractors import DocumentProcessor
-from processors import AIExtractor
-from automation import FormFiller
 from models import ClinicalDataExtraction
 
 # Load environment variables
@@ -23,150 +24,217 @@ st.set_page_config(
     layout="wide"
 )
 
+FORM_TEMPLATE_PATH = Path("sample_data/test_edc_form.html")
+
+# Matches the id attribute of every element in the EDC form template
+FIELD_ID_PATTERN = re.compile(r'id="(\w+)"')
+
+# Lab test name -> form field id: the first entry whose substrings all
+# appear in the normalized test name wins
+LAB_FIELD_MAP = (
+    (('glucose',), 'lab_glucose_value'),
+    (('hemoglobin',), 'lab_hgb_value'),
+    (('white_blood_cells',), 'lab_wbc_value'),
+    (('wbc',), 'lab_wbc_value'),
+    (('creatinine',), 'lab_creat_value'),
+    (('albumin',), 'lab_albumin_value'),
+    (('alt', 'alanine'), 'lab_alt_value'),
+    (('ast', 'aspartate'), 'lab_ast_value'),
+)
+
+# Abbreviations that only map when they are the whole test name
+LAB_EXACT_FIELD_MAP = {'alt': 'lab_alt_value', 'ast': 'lab_ast_value'}
+
+# Vital sign parameter substring -> form field id
+VITAL_FIELD_MAP = (
+    ('heart_rate', 'vital_hr'),
+    ('temperature', 'vital_temp'),
+    ('respiratory_rate', 'vital_rr'),
+    ('oxygen_saturation', 'vital_spo2'),
+)
+
+# Vital sign parameter -> name shown in the fill progress status
+VITAL_DISPLAY = {
+    'heart_rate': 'Heart Rate',
+    'temperature': 'Temperature',
+    'respiratory_rate': 'Respiratory Rate',
+    'oxygen_saturation': 'Oxygen Saturation',
+}
+
+# Delay between fields in the form-filling animation
+FILL_ANIMATION_DELAY_MS = 800
+
+FILL_ANIMATION_SCRIPT = """
+<script>
+(function (fields) {
+    fields.forEach(function (field, i) {
+        setTimeout(function () {
+            var element = document.getElementById(field.id);
+            if (element) {
+                element.value = field.value;
+            }
+        }, (i + 1) * field.delay_ms);
+    });
+})(%s);
+</script>
+"""
+
 # Initialize session state
 if 'extracted_data' not in st.session_state:
     st.session_state.extracted_data = None
 if 'form_filled' not in st.session_state:
     st.session_state.form_filled = False
+if 'extraction_version' not in st.session_state:
+    st.session_state.extraction_version = 0
+    st.session_state.extraction_cache = {}
 
 
-def generate_filled_form(extraction, html_content):
-    """Generate an HTML form pre-filled with extracted data"""
-    filled_html = html_content
+def set_extracted_data(extraction):
+    """Store a new extraction and invalidate everything derived from the old one"""
+    st.session_state.extracted_data = extraction
+    st.session_state.extraction_version += 1
+
+
+def cached_for_extraction(name, build):
+    """
+    Return build(extracted_data), computed once per extraction in this session
+    
+    Reruns that don't change the extraction reuse the stored result instead of
+    recomputing it; set_extracted_data bumps the version to invalidate it.
+    """
+    version = st.session_state.extraction_version
+    entry = st.session_state.extraction_cache.get(name)
+    if entry is None or entry[0] != version:
+        entry = (version, build(st.session_state.extracted_data))
+        st.session_state.extraction_cache[name] = entry
+    return entry[1]
+
+
+def extraction_to_json(extraction):
+    """Serialize an extraction as indented JSON bytes for the download button"""
+    return orjson.dumps(extraction.model_dump(), option=orjson.OPT_INDENT_2)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def process_uploaded_document(content_hash, _file_path):
+    """Process an uploaded document, cached by content hash so reruns skip rasterizing it again"""
+    # Imported here so app start-up doesn't pay for PIL/OpenCV/pdf2image
+    from extractors import DocumentProcessor
+    from processors import FIT_DETAIL_MAX_SIZE
+    
+    # Rasterize at the size the extractor sends, so it doesn't re-encode the image
+    processor = DocumentProcessor(max_image_size=(FIT_DETAIL_MAX_SIZE, FIT_DETAIL_MAX_SIZE))
+    return processor.process_document(_file_path)
+
+
+@st.cache_data(show_spinner=False)
+def load_form_template(path, mtime):
+    """Read the EDC form template once; mtime is part of the cache key so edits are picked up"""
+    return Path(path).read_text()
+
+
+def lab_field_id(field_name):
+    """Return the EDC form field id for a normalized lab test name (LabResult.key), or None if the form has no field for it"""
+    for keys, field_id in LAB_FIELD_MAP:
+        if all(key in field_name for key in keys):
+            return field_id
+    return LAB_EXACT_FIELD_MAP.get(field_name)
+
+
+def form_field_values(extraction):
+    """Map EDC form field ids to the extracted values that belong in them"""
+    values = {}
     
     # Fill lab results
     for lab in extraction.lab_results:
-        field_name = lab.test_name.lower().replace(' ', '_')
-        if 'glucose' in field_name:
-            filled_html = filled_html.replace('id="lab_glucose_value"', f'id="lab_glucose_value" value="{lab.value}"')
-        elif 'hemoglobin' in field_name:
-            filled_html = filled_html.replace('id="lab_hgb_value"', f'id="lab_hgb_value" value="{lab.value}"')
-        elif 'white_blood_cells' in field_name or 'wbc' in field_name:
-            filled_html = filled_html.replace('id="lab_wbc_value"', f'id="lab_wbc_value" value="{lab.value}"')
-        elif 'creatinine' in field_name:
-            filled_html = filled_html.replace('id="lab_creat_value"', f'id="lab_creat_value" value="{lab.value}"')
-        elif 'albumin' in field_name:
-            filled_html = filled_html.replace('id="lab_albumin_value"', f'id="lab_albumin_value" value="{lab.value}"')
-        elif 'alt' in field_name and 'alanine' in field_name:
-            filled_html = filled_html.replace('id="lab_alt_value"', f'id="lab_alt_value" value="{lab.value}"')
-        elif 'ast' in field_name and 'aspartate' in field_name:
-            filled_html = filled_html.replace('id="lab_ast_value"', f'id="lab_ast_value" value="{lab.value}"')
-        elif field_name == 'alt':
-            filled_html = filled_html.replace('id="lab_alt_value"', f'id="lab_alt_value" value="{lab.value}"')
-        elif field_name == 'ast':
-            filled_html = filled_html.replace('id="lab_ast_value"', f'id="lab_ast_value" value="{lab.value}"')
+        field_id = lab_field_id(lab.key)
+        if field_id:
+            values[field_id] = lab.value
     
     # Fill vital signs
     for vital in extraction.vital_signs:
-        param = vital.parameter.lower()
-        if 'heart_rate' in param:
-            filled_html = filled_html.replace('id="vital_hr"', f'id="vital_hr" value="{vital.value}"')
-        elif 'temperature' in param:
-            filled_html = filled_html.replace('id="vital_temp"', f'id="vital_temp" value="{vital.value}"')
-        elif 'respiratory_rate' in param:
-            filled_html = filled_html.replace('id="vital_rr"', f'id="vital_rr" value="{vital.value}"')
-        elif 'oxygen_saturation' in param:
-            filled_html = filled_html.replace('id="vital_spo2"', f'id="vital_spo2" value="{vital.value}"')
+        param = vital.key
+        field_id = next((fid for key, fid in VITAL_FIELD_MAP if key in param), None)
+        if field_id:
+            values[field_id] = vital.value
     
     # Fill blood pressure - only if values exist
     if extraction.blood_pressure:
         if extraction.blood_pressure.systolic is not None:
-            filled_html = filled_html.replace('id="bp_sys"', f'id="bp_sys" value="{extraction.blood_pressure.systolic}"')
+            values['bp_sys'] = extraction.blood_pressure.systolic
         if extraction.blood_pressure.diastolic is not None:
-            filled_html = filled_html.replace('id="bp_dia"', f'id="bp_dia" value="{extraction.blood_pressure.diastolic}"')
+            values['bp_dia'] = extraction.blood_pressure.diastolic
     
-    return filled_html
+    return values
+
+
+def generate_filled_form(extraction, html_content):
+    """Generate an HTML form pre-filled with extracted data"""
+    values = form_field_values(extraction)
+    if not values:
+        return html_content
+    
+    def fill_field(match):
+        field_id = match.group(1)
+        if field_id not in values:
+            return match.group(0)
+        return f'id="{field_id}" value="{values[field_id]}"'
+    
+    # Single pass over the HTML instead of one str.replace scan per field
+    return FIELD_ID_PATTERN.sub(fill_field, html_content)
+
+
+def generate_animated_form(extraction, html_content):
+    """Generate the empty form plus a script that types the extracted values in one at a time"""
+    fields = [
+        {"id": field_id, "value": str(value), "delay_ms": FILL_ANIMATION_DELAY_MS}
+        for field_id, value in form_field_values(extraction).items()
+    ]
+    # Escape "</" so a value can never close the script tag early
+    script = FILL_ANIMATION_SCRIPT % json.dumps(fields).replace("</", "<\\/")
+    
+    head, body_end, tail = html_content.rpartition("</body>")
+    if not body_end:
+        return html_content + script
+    return head + script + body_end + tail
 
 
 def animate_form_filling_iframe(extraction, status_text, progress_bar):
-    """Animate the form filling process with real form updates"""
-    import time
+    """
+    Report form-filling progress in the status area
     
-    progress = 60
+    The form itself is animated client-side by generate_animated_form, so
+    this no longer blocks the server while fields "fill".
+    """
     total_fields = len(extraction.lab_results) + len(extraction.vital_signs) + (1 if extraction.blood_pressure else 0)
     
     if total_fields == 0:
         return
     
-    progress_increment = 35 / total_fields  # 35% of progress bar for form filling
+    # Form filling covers 60-95% of the progress bar, one checkpoint per field
+    checkpoints = iter([min(60 + (i + 1) * 35 // total_fields, 95) for i in range(total_fields)])
     
-    # Get the base form HTML
-    form_path = Path("sample_data/test_edc_form.html")
-    if not form_path.exists():
+    # Nothing to animate without the form template
+    if not FORM_TEMPLATE_PATH.exists():
         return
-        
-    with open(form_path, 'r') as f:
-        base_form_html = f.read()
-    
-    # Create a partial extraction for progressive filling
-    partial_extraction = ClinicalDataExtraction(source_document="partial_fill")
     
     # Fill lab results one by one
-    for i, lab in enumerate(extraction.lab_results):
-        field_name = lab.test_name.lower().replace(' ', '_')
-        
-        # Add this lab result to our partial extraction
-        partial_extraction.lab_results.append(lab)
-        
-        if 'glucose' in field_name:
-            status_text.text(f"📊 Filling {lab.test_name}: {lab.value} {lab.unit}")
-        elif 'hemoglobin' in field_name:
-            status_text.text(f"📊 Filling {lab.test_name}: {lab.value} {lab.unit}")
-        elif 'white_blood_cells' in field_name or 'wbc' in field_name:
-            status_text.text(f"📊 Filling {lab.test_name}: {lab.value} {lab.unit}")
-        elif 'creatinine' in field_name:
-            status_text.text(f"📊 Filling {lab.test_name}: {lab.value} {lab.unit}")
-        else:
-            status_text.text(f"📊 Filling {lab.test_name}: {lab.value} {lab.unit}")
-        
-        # Update the form in real-time by updating session state
-        # Note: The form will refresh on the next Streamlit rerun
-        st.session_state.extracted_data = partial_extraction
-        
-        time.sleep(0.8)  # Pause for dramatic effect
-        progress += progress_increment
-        progress_bar.progress(min(int(progress), 95))
+    for lab in extraction.lab_results:
+        status_text.text(f"📊 Filling {lab.test_name}: {lab.value} {lab.unit}")
+        progress_bar.progress(next(checkpoints))
     
     # Fill vital signs one by one
     for vital in extraction.vital_signs:
-        param = vital.parameter.lower()
-        
-        # Add this vital sign to our partial extraction
-        partial_extraction.vital_signs.append(vital)
-        
-        if 'heart_rate' in param:
-            display_name = 'Heart Rate'
-        elif 'temperature' in param:
-            display_name = 'Temperature'
-        elif 'respiratory_rate' in param:
-            display_name = 'Respiratory Rate'
-        elif 'oxygen_saturation' in param:
-            display_name = 'Oxygen Saturation'
-        else:
-            display_name = param.replace('_', ' ').title()
+        param = vital.key
+        display_name = VITAL_DISPLAY.get(param) or param.replace('_', ' ').title()
         
         status_text.text(f"❤️ Filling {display_name}: {vital.value} {vital.unit}")
-        
-        # Update the form in real-time by updating session state
-        # Note: The form will refresh on the next Streamlit rerun
-        st.session_state.extracted_data = partial_extraction
-        
-        time.sleep(0.8)
-        progress += progress_increment
-        progress_bar.progress(min(int(progress), 95))
+        progress_bar.progress(next(checkpoints))
     
     # Fill blood pressure
     if extraction.blood_pressure:
-        partial_extraction.blood_pressure = extraction.blood_pressure
-        
         status_text.text(f"🩺 Filling Blood Pressure: {extraction.blood_pressure.systolic}/{extraction.blood_pressure.diastolic} {extraction.blood_pressure.unit}")
-        
-        # Final form update
-        st.session_state.extracted_data = partial_extraction
-        
-        time.sleep(0.8)
-        progress += progress_increment
-        progress_bar.progress(min(int(progress), 95))
+        progress_bar.progress(next(checkpoints))
 
 
 def merge_extractions(existing_extraction, new_extraction):
@@ -180,36 +248,39 @@ def merge_extractions(existing_extraction, new_extraction):
         patient_id=existing_extraction.patient_id or new_extraction.patient_id
     )
     
-    # Start with existing data
+    # Start with existing data; copied so the stored extraction stays intact
+    # if the script is stopped or rerun before the merged one replaces it
     merged.lab_results = existing_extraction.lab_results.copy()
     merged.vital_signs = existing_extraction.vital_signs.copy()
     merged.blood_pressure = existing_extraction.blood_pressure
     
     # Add new lab results (avoid duplicates by test name)
-    existing_lab_names = {lab.test_name.lower() for lab in merged.lab_results}
+    lab_index = {}
+    for i, lab in enumerate(merged.lab_results):
+        lab_index.setdefault(lab.key, i)
     for new_lab in new_extraction.lab_results:
-        if new_lab.test_name.lower() not in existing_lab_names:
+        key = new_lab.key
+        i = lab_index.get(key)
+        if i is None:
+            lab_index[key] = len(merged.lab_results)
             merged.lab_results.append(new_lab)
-        else:
+        elif new_lab.confidence > merged.lab_results[i].confidence:
             # Update existing lab result with newer confidence if higher
-            for i, existing_lab in enumerate(merged.lab_results):
-                if existing_lab.test_name.lower() == new_lab.test_name.lower():
-                    if new_lab.confidence > existing_lab.confidence:
-                        merged.lab_results[i] = new_lab
-                    break
+            merged.lab_results[i] = new_lab
     
     # Add new vital signs (avoid duplicates by parameter)
-    existing_vital_params = {vital.parameter.lower() for vital in merged.vital_signs}
+    vital_index = {}
+    for i, vital in enumerate(merged.vital_signs):
+        vital_index.setdefault(vital.key, i)
     for new_vital in new_extraction.vital_signs:
-        if new_vital.parameter.lower() not in existing_vital_params:
+        key = new_vital.key
+        i = vital_index.get(key)
+        if i is None:
+            vital_index[key] = len(merged.vital_signs)
             merged.vital_signs.append(new_vital)
-        else:
+        elif new_vital.confidence > merged.vital_signs[i].confidence:
             # Update existing vital sign with newer confidence if higher
-            for i, existing_vital in enumerate(merged.vital_signs):
-                if existing_vital.parameter.lower() == new_vital.parameter.lower():
-                    if new_vital.confidence > existing_vital.confidence:
-                        merged.vital_signs[i] = new_vital
-                    break
+            merged.vital_signs[i] = new_vital
     
     # Update blood pressure if new one has higher confidence or if we don't have one
     if new_extraction.blood_pressure:
@@ -227,9 +298,10 @@ def animate_form_filling(extraction, base_html, form_container, status_text, pro
     return animate_form_filling_iframe(extraction, status_text, progress_bar)
 
 
-def main():
-    # Add custom CSS for two-application look
-    st.markdown("""
+@st.cache_resource
+def _app_css():
+    """Styles for the two-application layout, built once per process"""
+    return """
     <style>
     .main-container {
         display: flex;
@@ -346,7 +418,46 @@ def main():
         padding: 0 10px;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+
+@st.cache_resource
+def _edc_chrome():
+    """Window chrome for the MediRave EDC application"""
+    return """
+    <div class="edc-application">
+        <div class="edc-header">
+            <div>🏥 VeedaData MediRave™ EDC System v2.1</div>
+            <div class="window-controls">
+                <div class="window-control close"></div>
+                <div class="window-control minimize"></div>
+                <div class="window-control maximize"></div>
+            </div>
+        </div>
+    </div>
+    """
+
+
+@st.cache_resource
+def _ai_chrome():
+    """Window chrome for the AI extractor application"""
+    return """
+    <div class="ai-application">
+        <div class="ai-header">
+            <div>🤖 Joe's AI Extractor Pro</div>
+            <div class="window-controls">
+                <div class="window-control close"></div>
+                <div class="window-control minimize"></div>
+                <div class="window-control maximize"></div>
+            </div>
+        </div>
+    </div>
+    """
+
+
+def main():
+    # Add custom CSS for two-application look
+    st.markdown(_app_css(), unsafe_allow_html=True)
     
     # Configuration in sidebar
     with st.sidebar:
@@ -366,18 +477,7 @@ def main():
     
     # Left side - MediRave EDC Application
     with col1:
-        st.markdown("""
-        <div class="edc-application">
-            <div class="edc-header">
-                <div>🏥 VeedaData MediRave™ EDC System v2.1</div>
-                <div class="window-controls">
-                    <div class="window-control close"></div>
-                    <div class="window-control minimize"></div>
-                    <div class="window-control maximize"></div>
-                </div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.html(_edc_chrome())
         
         # Content inside the window
         with st.container():
@@ -394,16 +494,24 @@ def main():
                 st.info("⏳ Waiting for data extraction...")
             
             # Form display - always show the form
-            form_path = Path("sample_data/test_edc_form.html")
+            form_path = FORM_TEMPLATE_PATH
             
             # Always display the form
             if form_path.exists():
-                with open(form_path, 'r') as f:
-                    base_form_html = f.read()
+                form_mtime = form_path.stat().st_mtime
+                base_form_html = load_form_template(str(form_path), form_mtime)
                 
                 # If we have extracted data, fill the form with it
                 if st.session_state.extracted_data and st.session_state.extracted_data.overall_confidence > 0:
-                    filled_form_html = generate_filled_form(st.session_state.extracted_data, base_form_html)
+                    # Play the fill animation once, right after an extraction
+                    if st.session_state.pop('animate_form_fill', False):
+                        filled_form_html = generate_animated_form(st.session_state.extracted_data, base_form_html)
+                    else:
+                        # Only re-rendered when the extraction or the template changes
+                        filled_form_html = cached_for_extraction(
+                            ("filled_form", form_mtime),
+                            lambda extraction: generate_filled_form(extraction, base_form_html)
+                        )
                     components.html(filled_form_html, height=500, scrolling=True)
                 else:
                     # Show empty form
@@ -426,39 +534,36 @@ def main():
     
     # Right side - AI Extraction Application
     with col2:
-        st.markdown("""
-        <div class="ai-application">
-            <div class="ai-header">
-                <div>🤖 Joe's AI Extractor Pro</div>
-                <div class="window-controls">
-                    <div class="window-control close"></div>
-                    <div class="window-control minimize"></div>
-                    <div class="window-control maximize"></div>
-                </div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.html(_ai_chrome())
         
         # Content inside the window
         with st.container():
             st.markdown("### 📄 Source Document")
             st.markdown("*Upload your lab report, vital signs sheet, or medical record*")
             
-            # File upload
-            uploaded_file = st.file_uploader(
-                "Choose file",
-                type=['pdf', 'png', 'jpg', 'jpeg'],
-                help="Support: PDF, PNG, JPG, JPEG"
-            )
-        
-            if uploaded_file:
-                # Save uploaded file temporarily
-                temp_path = Path(f"temp_{uploaded_file.name}")
-                with open(temp_path, 'wb') as f:
-                    f.write(uploaded_file.getvalue())
+            # File upload and extract button share a form so the app only
+            # reruns when the user submits, not on every uploader interaction
+            with st.form("extract_form"):
+                uploaded_file = st.file_uploader(
+                    "Choose file",
+                    type=['pdf', 'png', 'jpg', 'jpeg'],
+                    help="Support: PDF, PNG, JPG, JPEG"
+                )
                 
                 # Extract button - moved higher up
-                if st.button("🚀 Extract & Auto-Fill MediRave", type="primary"):
+                submitted = st.form_submit_button("🚀 Extract & Auto-Fill MediRave", type="primary")
+            
+            if submitted and not uploaded_file:
+                st.warning("⚠️ Choose a file to extract first.")
+        
+            if uploaded_file:
+                if submitted:
+                    # Stream the upload into a temp file (the processor works on paths)
+                    uploaded_file.seek(0)
+                    with tempfile.NamedTemporaryFile(suffix=Path(uploaded_file.name).suffix, delete=False) as tmp:
+                        shutil.copyfileobj(uploaded_file, tmp)
+                    temp_path = Path(tmp.name)
+                    
                     # Progress tracking below the button
                     progress_bar = st.progress(0)
                     status_text = st.empty()
@@ -468,14 +573,16 @@ def main():
                         status_text.text("🔍 Processing document...")
                         progress_bar.progress(20)
                         
-                        processor = DocumentProcessor()
-                        image_base64, image_format = processor.process_document(temp_path)
+                        content_hash = hashlib.blake2b(uploaded_file.getbuffer()).hexdigest()
+                        image_base64, image_format = process_uploaded_document(content_hash, temp_path)
                         
                         # Step 2: AI Analysis
                         status_text.text("🤖 AI analyzing document...")
                         progress_bar.progress(40)
                         
-                        extractor = AIExtractor(api_key=api_key)
+                        from processors import get_extractor
+                        
+                        extractor = get_extractor(api_key=api_key)
                         new_extraction = extractor.extract_clinical_data(image_base64, image_format)
                         
                         # Step 3: Merge with existing data
@@ -494,7 +601,7 @@ def main():
                         animate_form_filling_iframe(merged_extraction, status_text, progress_bar)
                         
                         # Store merged data in session state
-                        st.session_state.extracted_data = merged_extraction
+                        set_extracted_data(merged_extraction)
                         
                         # Final success message with celebration
                         progress_bar.progress(100)
@@ -511,6 +618,7 @@ def main():
                             st.balloons()
                             
                             # Force immediate form update by triggering a rerun
+                            st.session_state.animate_form_fill = True
                             st.rerun()
                             
                         else:
@@ -520,14 +628,13 @@ def main():
                         status_text.error(f"❌ Error during extraction: {str(e)}")
                         progress_bar.progress(0)
                         # Still create empty extraction to prevent further errors
-                        st.session_state.extracted_data = ClinicalDataExtraction(
+                        set_extracted_data(ClinicalDataExtraction(
                             source_document="error",
                             overall_confidence=0.0
-                        )
+                        ))
                     finally:
                         # Clean up temp file
-                        if temp_path.exists():
-                            temp_path.unlink()
+                        temp_path.unlink(missing_ok=True)
                 
                 # Display uploaded document below the button
                 st.markdown("---")
@@ -562,7 +669,8 @@ def main():
                 
                 # Export options
                 st.subheader("📤 Export Data")
-                json_data = extraction.model_dump_json(indent=2)
+                # Serialized once per extraction, not on every rerun
+                json_data = cached_for_extraction("json", extraction_to_json)
                 st.download_button(
                     label="Download JSON",
                     data=json_data,
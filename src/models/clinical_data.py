@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Union
-from pydantic import BaseModel, Field, validator
+from typing import Optional, List, Dict, Any, Union, Iterator
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator
 from enum import Enum
+from itertools import chain
 
 
 class ConfidenceLevel(str, Enum):
@@ -10,7 +11,20 @@ class ConfidenceLevel(str, Enum):
     LOW = "low"
 
 
+# Common abbreviations -> standard vital sign parameter names
+PARAMETER_MAP = {
+    'bp': 'blood_pressure',
+    'hr': 'heart_rate',
+    'temp': 'temperature',
+    'rr': 'respiratory_rate',
+    'spo2': 'oxygen_saturation',
+    'o2 sat': 'oxygen_saturation'
+}
+
+
 class LabResult(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, validate_assignment=False)
+    
     test_name: str = Field(..., description="Name of the lab test")
     value: float = Field(..., description="Numeric result value")
     unit: str = Field(..., description="Unit of measurement")
@@ -19,19 +33,27 @@ class LabResult(BaseModel):
     abnormal_flag: Optional[str] = Field(None, description="H/L/N flag")
     confidence: float = Field(1.0, ge=0.0, le=1.0, description="Extraction confidence")
     
-    @validator('abnormal_flag')
+    _key: str = PrivateAttr()
+    
+    def model_post_init(self, __context: Any) -> None:
+        self._key = self.test_name.lower().replace(' ', '_')
+    
+    @property
+    def key(self) -> str:
+        """Normalized test name (lowercase, underscores) used to match and deduplicate results"""
+        return self._key
+    
+    @field_validator('abnormal_flag')
+    @classmethod
     def validate_abnormal_flag(cls, v):
         if v and v.upper() not in ['H', 'L', 'N', 'HIGH', 'LOW', 'NORMAL']:
             raise ValueError('Abnormal flag must be H, L, or N')
         return v.upper()[0] if v else None
-    
-    class Config:
-        json_encoders = {
-            datetime: lambda v: v.isoformat() if v else None
-        }
 
 
 class VitalSign(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, validate_assignment=False)
+    
     parameter: str = Field(..., description="Vital sign parameter name")
     value: Union[str, int, float] = Field(..., description="Measured value (handles various formats)")
     unit: str = Field(..., description="Unit of measurement")
@@ -39,20 +61,21 @@ class VitalSign(BaseModel):
     position: Optional[str] = Field(None, description="Patient position during measurement")
     confidence: float = Field(1.0, ge=0.0, le=1.0, description="Extraction confidence")
     
-    @validator('parameter')
+    @field_validator('parameter')
+    @classmethod
     def standardize_parameter(cls, v):
-        parameter_map = {
-            'bp': 'blood_pressure',
-            'hr': 'heart_rate',
-            'temp': 'temperature',
-            'rr': 'respiratory_rate',
-            'spo2': 'oxygen_saturation',
-            'o2 sat': 'oxygen_saturation'
-        }
-        return parameter_map.get(v.lower(), v.lower())
+        v = v.lower()
+        return PARAMETER_MAP.get(v, v)
+    
+    @property
+    def key(self) -> str:
+        """Normalized parameter name; already lowercased by standardize_parameter"""
+        return self.parameter
 
 
 class BloodPressure(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, validate_assignment=False)
+    
     systolic: Optional[float] = Field(None, description="Systolic pressure")
     diastolic: Optional[float] = Field(None, description="Diastolic pressure")
     unit: str = Field("mmHg", description="Unit of measurement")
@@ -62,6 +85,8 @@ class BloodPressure(BaseModel):
 
 
 class ClinicalDataExtraction(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, validate_assignment=False)
+    
     source_document: str = Field(..., description="Source document identifier")
     extraction_timestamp: datetime = Field(default_factory=datetime.now)
     patient_id: Optional[str] = Field(None, description="Patient identifier if available")
@@ -73,15 +98,20 @@ class ClinicalDataExtraction(BaseModel):
     overall_confidence: float = Field(0.0, ge=0.0, le=1.0)
     metadata: Dict[str, Any] = Field(default_factory=dict)
     
+    def _confidences(self) -> Iterator[float]:
+        items = chain(self.lab_results, self.vital_signs, [self.blood_pressure] if self.blood_pressure else [])
+        return (item.confidence for item in items)
+    
     def calculate_overall_confidence(self):
-        all_confidences = []
-        all_confidences.extend([lr.confidence for lr in self.lab_results])
-        all_confidences.extend([vs.confidence for vs in self.vital_signs])
-        if self.blood_pressure:
-            all_confidences.append(self.blood_pressure.confidence)
+        # Running sum/count so no temporary lists are built
+        total = 0.0
+        count = 0
+        for confidence in self._confidences():
+            total += confidence
+            count += 1
         
-        if all_confidences:
-            self.overall_confidence = sum(all_confidences) / len(all_confidences)
+        if count:
+            self.overall_confidence = total / count
         return self.overall_confidence
     
     def get_confidence_level(self) -> ConfidenceLevel:
@@ -1,3 +1,22 @@
-from .ai_extractor import AIExtractor
+import functools
+from typing import Optional
 
-__all__ = ["AIExtractor"]
\ No newline at end of file
+from .ai_extractor import AIExtractor, FIT_DETAIL_MAX_SIZE
+from .ai_extractor_batch import BatchAIExtractor
+from .llm_cache import LLMCache
+
+
+@functools.lru_cache(maxsize=1)
+def get_extractor(api_key: Optional[str] = None, cache_dir: Optional[str] = None) -> AIExtractor:
+    """
+    Return a shared AIExtractor, so its HTTP connection pool (and the TLS
+    sessions in it) is reused across documents instead of rebuilt per call
+    
+    Args:
+        api_key: OpenAI API key; defaults to OPENAI_API_KEY
+        cache_dir: Directory for an LLMCache, or None to always call the API
+    """
+    return AIExtractor(api_key=api_key, cache=LLMCache(cache_dir) if cache_dir else None)
+
+
+__all__ = ["AIExtractor", "BatchAIExtractor", "LLMCache", "FIT_DETAIL_MAX_SIZE", "get_extractor"]
\ No newline at end of file
@@ -1,70 +1,73 @@
 import os
-import json
-from typing import Dict, Any, Optional, List
-from openai import OpenAI
+import io
+import orjson
+import base64
+import asyncio
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+import ijson
+from typing import Dict, Any, Optional, List, Literal, Tuple, Union, AsyncIterator, Iterator
+from openai import OpenAI, AsyncOpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from PIL import Image
+from pydantic import ValidationError
 import logging
 from models.clinical_data import ClinicalDataExtraction, LabResult, VitalSign, BloodPressure
+from .llm_cache import LLMCache
 
 logger = logging.getLogger(__name__)
 
+# Use gpt-4o for best quality, gpt-4o-mini for speed/cost
+DEFAULT_MODEL = "gpt-4o-mini"
 
-class AIExtractor:
-    """Uses AI models to extract clinical data from documents"""
-    
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("OpenAI API key not provided")
-        
-        self.client = OpenAI(api_key=self.api_key)
-        self.model = "gpt-4o-mini"  # Use gpt-4o for best quality, gpt-4o-mini for speed/cost
-    
-    def extract_clinical_data(self, image_base64: str, image_format: str) -> ClinicalDataExtraction:
-        """Extract lab results and vital signs from image"""
+# Output cap; a full lab panel plus vitals comes to roughly 300-800 tokens
+# TODO: size this from the expected row count when batch callers can pass a hint
+MAX_OUTPUT_TOKENS = 1200
+
+# With detail="fit", images are shrunk to fit this size and sent at high detail.
+# Rasterize documents at this size (DocumentProcessor(max_image_size=...)) so
+# they go out as-is instead of being decoded and re-encoded here
+FIT_DETAIL_MAX_SIZE = 1024
+
+# Transient API failures worth retrying: rate limits, timeouts, dropped connections, 5xx
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+MAX_ATTEMPTS = 6
+MAX_RETRY_AFTER = 60
+
+_backoff = wait_random_exponential(min=1, max=30)
+
+
+def _wait_retry_after(retry_state) -> float:
+    """Wait as long as the server's Retry-After header asks, else back off exponentially with jitter"""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is not None:
         try:
-            # Prepare the prompt
-            prompt = self._create_extraction_prompt()
-            
-            # Call GPT-4 Vision
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a medical data extraction expert. Extract clinical data accurately and provide confidence scores."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:{image_format};base64,{image_base64}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.1
-            )
-            
-            # Parse the response
-            extracted_data = self._parse_ai_response(response.choices[0].message.content)
-            return extracted_data
-            
-        except Exception as e:
-            logger.error(f"AI extraction failed: {e}")
-            raise
-    
-    def _create_extraction_prompt(self) -> str:
-        """Create detailed prompt for data extraction"""
-        return """
+            return min(float(response.headers["retry-after"]), MAX_RETRY_AFTER)
+        except (KeyError, ValueError):
+            pass
+    return _backoff(retry_state)
+
+
+_retry_api_call = retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=_wait_retry_after,
+    stop=stop_after_attempt(MAX_ATTEMPTS),
+    reraise=True
+)
+
+# Vision detail level: "low" is a flat 85 tokens, "high" tiles the image in
+# 512px patches and "auto" lets OpenAI pick between them. "fit" is ours: it
+# shrinks the image to FIT_DETAIL_MAX_SIZE if needed, then uses "high"
+Detail = Literal["low", "high", "auto", "fit"]
+
+# Identical for every document, so it is built once at import; dedented so
+# the source indentation isn't sent (and billed) as prompt tokens. Sent as the
+# system message so every request starts with the same prefix, which lets
+# OpenAI's automatic prompt caching reuse it across documents.
+_EXTRACTION_PROMPT = textwrap.dedent("""
+        You are a medical data extraction expert. Extract clinical data accurately and provide confidence scores.
+        
         Analyze this medical document and extract ALL lab results and vital signs.
         
         For LAB RESULTS, extract:
@@ -126,56 +129,396 @@ class AIExtractor:
         - Only include fields where you can extract actual values
         - Standardize units (e.g., "beats/min" -> "bpm")
         - For blood pressure, only include if you can identify systolic/diastolic values
-        """
+        """).strip()
+
+
+# Follow-up sent when a response couldn't be parsed, asking for just the JSON
+_JSON_REMINDER = (
+    "Your previous reply was not a single valid JSON object. Reply again with only the "
+    "JSON object, in exactly the format described, with no other text."
+)
+
+
+def _find_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} block in text, or None; braces inside strings are ignored"""
+    start = text.find("{")
+    if start < 0:
+        return None
     
-    def _parse_ai_response(self, response: str) -> ClinicalDataExtraction:
-        """Parse AI response into structured data"""
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _load_json(response: str) -> Dict[str, Any]:
+    """Decode the response, falling back to the first JSON object embedded in it"""
+    try:
+        return orjson.loads(response)
+    except orjson.JSONDecodeError:
+        block = _find_json_object(response)
+        if block is None:
+            raise
+        return orjson.loads(block)
+
+
+# JSON path of each object streamed out of a response -> model it becomes
+_STREAMED_MODELS = {
+    "lab_results.item": LabResult,
+    "vital_signs.item": VitalSign,
+    "blood_pressure": BloodPressure,
+}
+
+StreamedItem = Union[LabResult, VitalSign, BloodPressure]
+
+
+class _StreamedItemBuilder:
+    """Assembles ijson parse events into lab, vital and blood pressure models as each object closes"""
+    
+    def __init__(self):
+        self._prefix: Optional[str] = None
+        self._builder: Optional[ijson.ObjectBuilder] = None
+    
+    def feed(self, events: List[Tuple[str, str, Any]]) -> Iterator[StreamedItem]:
+        for prefix, event, value in events:
+            if self._builder is None:
+                if event == "start_map" and prefix in _STREAMED_MODELS:
+                    self._prefix = prefix
+                    self._builder = ijson.ObjectBuilder()
+                    self._builder.event(event, value)
+                continue
+            
+            self._builder.event(event, value)
+            if event == "end_map" and prefix == self._prefix:
+                item = self._validate(self._prefix, self._builder.value)
+                self._prefix = self._builder = None
+                if item is not None:
+                    yield item
+    
+    def _validate(self, prefix: str, data: Dict[str, Any]) -> Optional[StreamedItem]:
+        """Validate one object, skipping it the same way _parse_items would"""
+        if prefix == "blood_pressure" and data.get("systolic") is None and data.get("diastolic") is None:
+            return None
+        try:
+            return _STREAMED_MODELS[prefix].model_validate(data)
+        except ValidationError as e:
+            logger.warning("Skipping invalid streamed item at %s: %s", prefix, e)
+            return None
+
+
+class AIExtractor:
+    """Uses AI models to extract clinical data from documents"""
+    
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[LLMCache] = None,
+                 model: Optional[str] = None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OpenAI API key not provided")
+        
+        # Retries are handled by _call_api/_acall_api, so the SDK's own are off
+        self.client = OpenAI(api_key=self.api_key, max_retries=0)
+        self.aclient = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        self.model = model or os.getenv("OPENAI_VISION_MODEL", DEFAULT_MODEL)
+        # Optional response cache; skips the API call for documents already extracted
+        self.cache = cache
+    
+    def extract_clinical_data(self, image_base64: str, image_format: str,
+                              detail: Detail = "fit") -> ClinicalDataExtraction:
+        """Extract lab results and vital signs from image"""
+        cache_key = self._cache_key(image_base64, image_format, detail)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            # Extract JSON from response
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            json_str = response[json_start:json_end]
+            request = self._build_request(image_base64, image_format, detail)
+            # The data URL in the request holds the image now; drop this
+            # reference so a downscaled-away original can be freed during the call
+            del image_base64
             
-            data = json.loads(json_str)
+            # Call GPT-4 Vision
+            content = self._call_api(request)
             
-            # Create extraction object
-            extraction = ClinicalDataExtraction(
-                source_document="ai_extraction"
-            )
+            # Parse the response, asking once more if it wasn't usable JSON
+            extracted_data = self._parse_ai_response(content)
+            if extracted_data.source_document == "ai_extraction_failed":
+                content = self._call_api(self._build_retry_request(request, content))
+                extracted_data = self._parse_ai_response(content)
+            self._cache_set(cache_key, extracted_data)
+            return extracted_data
             
-            # Parse lab results - skip invalid ones
-            for lab_data in data.get("lab_results", []):
-                try:
-                    # Skip if missing required fields
-                    if not lab_data.get("test_name") or lab_data.get("value") is None:
-                        continue
-                    lab_result = LabResult(**lab_data)
-                    extraction.lab_results.append(lab_result)
-                except Exception as e:
-                    logger.warning(f"Skipping invalid lab result: {e}")
-                    continue
+        except Exception as e:
+            logger.error("AI extraction failed: %s", e)
+            raise
+    
+    def extract_pages(self, images: List[Tuple[str, str]], max_workers: int = 8,
+                      detail: Detail = "fit") -> List[ClinicalDataExtraction]:
+        """
+        Extract several pages of one document in parallel threads
+        
+        The HTTP calls release the GIL while waiting, so up to max_workers
+        pages are in flight at once without going async.
+        
+        Args:
+            images: (image_base64, image_format) per page, as returned by
+                DocumentProcessor.process_document_pages
+        
+        Returns:
+            One extraction per page, in page order
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(
+                lambda image: self.extract_clinical_data(image[0], image[1], detail),
+                images
+            ))
+    
+    async def aextract_clinical_data(self, image_base64: str, image_format: str,
+                                     detail: Detail = "fit") -> ClinicalDataExtraction:
+        """Async version of extract_clinical_data"""
+        cache_key = self._cache_key(image_base64, image_format, detail)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            request = self._build_request(image_base64, image_format, detail)
+            del image_base64
+            content = await self._acall_api(request)
+            extracted_data = self._parse_ai_response(content)
+            if extracted_data.source_document == "ai_extraction_failed":
+                content = await self._acall_api(self._build_retry_request(request, content))
+                extracted_data = self._parse_ai_response(content)
+            self._cache_set(cache_key, extracted_data)
+            return extracted_data
+            
+        except Exception as e:
+            logger.error("AI extraction failed: %s", e)
+            raise
+    
+    async def aextract_many(self, images: List[Tuple[str, str]], concurrency: int = 16,
+                            detail: Detail = "fit") -> List[Union[ClinicalDataExtraction, Exception]]:
+        """
+        Extract many images concurrently, with at most `concurrency` requests in flight
+        
+        Args:
+            images: (image_base64, image_format) pairs, as returned by DocumentProcessor
+            concurrency: Upper bound on simultaneous API calls; keep it under the account's rate limit
+            detail: Vision detail level, see Detail
             
-            # Parse vital signs - skip invalid ones
-            for vital_data in data.get("vital_signs", []):
-                try:
-                    # Skip if missing required fields
-                    if not vital_data.get("parameter") or vital_data.get("value") is None:
+        Returns:
+            One entry per image, in order: the extraction, or the exception if that call failed
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def extract_one(image_base64: str, image_format: str) -> ClinicalDataExtraction:
+            async with semaphore:
+                return await self.aextract_clinical_data(image_base64, image_format, detail)
+        
+        return await asyncio.gather(
+            *(extract_one(image_base64, image_format) for image_base64, image_format in images),
+            return_exceptions=True
+        )
+    
+    async def aiter_extract(self, image_base64: str, image_format: str,
+                            detail: Detail = "fit") -> AsyncIterator[StreamedItem]:
+        """
+        Stream the extraction, yielding each lab result, vital sign and blood
+        pressure reading as soon as the model has finished writing it
+        
+        Lets callers start filling form fields before the whole response has
+        arrived. Streamed calls always go to the API; the response cache
+        only stores complete extractions. There is no re-prompt on this path:
+        a truncated or malformed response is logged and the stream ends after
+        the last complete item.
+        """
+        request = self._build_request(image_base64, image_format, detail)
+        del image_base64
+        
+        events = ijson.sendable_list()
+        parser = ijson.parse_coro(events, use_float=True)
+        builder = _StreamedItemBuilder()
+        
+        stream = await self._acall_stream(request)
+        try:
+            try:
+                async for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
                         continue
-                    vital_sign = VitalSign(**vital_data)
-                    extraction.vital_signs.append(vital_sign)
-                except Exception as e:
-                    logger.warning(f"Skipping invalid vital sign: {e}")
-                    continue
+                    parser.send(chunk.choices[0].delta.content.encode())
+                    for item in builder.feed(events):
+                        yield item
+                    del events[:]
+                
+                parser.close()
+            except ijson.JSONError as e:
+                # Also covers IncompleteJSONError, raised when the response is cut off
+                logger.error("Failed to parse streamed AI response: %s", e)
+            
+            # Events the parser produced before it finished or failed
+            for item in builder.feed(events):
+                yield item
+        finally:
+            # Also runs when the caller stops iterating early, so the connection isn't left open
+            await stream.close()
+    
+    @_retry_api_call
+    def _call_api(self, request: Dict[str, Any]) -> str:
+        """Send one chat.completions request, retrying transient failures; returns the message content"""
+        response = self.client.chat.completions.create(**request)
+        return response.choices[0].message.content
+    
+    @_retry_api_call
+    async def _acall_api(self, request: Dict[str, Any]) -> str:
+        """Async version of _call_api"""
+        response = await self.aclient.chat.completions.create(**request)
+        return response.choices[0].message.content
+    
+    @_retry_api_call
+    async def _acall_stream(self, request: Dict[str, Any]):
+        """Open a streamed chat.completions request, retrying transient failures to connect"""
+        return await self.aclient.chat.completions.create(**request, stream=True)
+    
+    def _cache_key(self, image_base64: str, image_format: str, detail: Detail) -> Optional[str]:
+        """Key a response on everything that determines it: model, prompt, detail and image"""
+        if self.cache is None:
+            return None
+        return LLMCache.make_key(self.model, self._create_extraction_prompt(), detail, image_format, image_base64)
+    
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[ClinicalDataExtraction]:
+        """Return the cached extraction for a key, if caching is on and it's there"""
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        logger.info("Using cached extraction")
+        return ClinicalDataExtraction.model_validate_json(cached)
+    
+    def _cache_set(self, cache_key: Optional[str], extraction: ClinicalDataExtraction):
+        """Cache a successful extraction; failed parses are left uncached so they get retried"""
+        if cache_key is not None and extraction.source_document != "ai_extraction_failed":
+            self.cache.set(cache_key, extraction.model_dump_json())
+    
+    def _build_request(self, image_base64: str, image_format: str, detail: Detail = "fit") -> Dict[str, Any]:
+        """Build the chat.completions request body for one document image"""
+        if detail == "fit":
+            image_base64, image_format = self._downscale_image(image_base64, image_format, FIT_DETAIL_MAX_SIZE)
+            detail = "high"
+        
+        # Prepare the prompt
+        prompt = self._create_extraction_prompt()
+        
+        # Stable instructions first, the per-document image last
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": prompt
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": "".join(("data:", image_format, ";base64,", image_base64)),
+                                "detail": detail
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": "Extract the clinical data from this document."
+                        }
+                    ]
+                }
+            ],
+            # JSON mode: the model can only emit a single valid JSON object
+            "response_format": {"type": "json_object"},
+            "max_tokens": MAX_OUTPUT_TOKENS,
+            "temperature": 0.1
+        }
+    
+    def _build_retry_request(self, request: Dict[str, Any], failed_content: str) -> Dict[str, Any]:
+        """
+        Follow up an unparseable reply: show the model what it sent and ask for
+        the JSON alone. The output cap is doubled in case the first reply was
+        cut off mid-object.
+        """
+        return {
+            **request,
+            "messages": [
+                *request["messages"],
+                {"role": "assistant", "content": failed_content or ""},
+                {"role": "user", "content": _JSON_REMINDER}
+            ],
+            "max_tokens": 2 * MAX_OUTPUT_TOKENS
+        }
+    
+    def _downscale_image(self, image_base64: str, image_format: str, max_size: int) -> Tuple[str, str]:
+        """
+        Shrink an image to fit max_size x max_size; returned unchanged if it already fits
+        
+        Image.open only reads the header, so images that fit are never decoded
+        or re-encoded. Oversized ones take a second lossy JPEG generation.
+        """
+        image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+        if max(image.size) <= max_size:
+            return image_base64, image_format
+        
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == "image/png":
+            image.save(buffer, format="PNG", compress_level=1)
+        else:
+            image.convert("RGB").save(buffer, format="JPEG", quality=85)
+            image_format = "image/jpeg"
+        return base64.b64encode(buffer.getbuffer()).decode("ascii"), image_format
+    
+    def _create_extraction_prompt(self) -> str:
+        """Return the data extraction prompt"""
+        return _EXTRACTION_PROMPT
+    
+    def _parse_ai_response(self, response: str) -> ClinicalDataExtraction:
+        """Parse AI response into structured data"""
+        try:
+            # JSON mode should make the whole message the object; if something
+            # else slipped in, fall back to the first balanced {...} block
+            data = _load_json(response)
+            
+            # Blood pressure without either reading is treated as absent
+            bp_data = data.get("blood_pressure")
+            if bp_data and bp_data.get("systolic") is None and bp_data.get("diastolic") is None:
+                data["blood_pressure"] = None
             
-            # Parse blood pressure - skip if invalid
-            if data.get("blood_pressure"):
-                try:
-                    bp_data = data["blood_pressure"]
-                    # Only create if we have at least one valid value
-                    if bp_data.get("systolic") is not None or bp_data.get("diastolic") is not None:
-                        extraction.blood_pressure = BloodPressure(**bp_data)
-                except Exception as e:
-                    logger.warning(f"Skipping invalid blood pressure: {e}")
+            # Validate the whole response in one pass; only fall back to
+            # item-by-item parsing (skipping bad rows) if some item is invalid
+            try:
+                extraction = ClinicalDataExtraction.model_validate({
+                    "source_document": "ai_extraction",
+                    "lab_results": data.get("lab_results") or [],
+                    "vital_signs": data.get("vital_signs") or [],
+                    "blood_pressure": data.get("blood_pressure")
+                })
+            except ValidationError as e:
+                logger.warning("Response failed validation, parsing item by item: %d errors", e.error_count())
+                extraction = self._parse_items(data)
             
             # Calculate overall confidence
             extraction.calculate_overall_confidence()
@@ -183,11 +526,51 @@ class AIExtractor:
             return extraction
             
         except Exception as e:
-            logger.error(f"Failed to parse AI response: {e}")
-            logger.debug(f"Response was: {response}")
+            logger.error("Failed to parse AI response: %s", e)
+            logger.debug("Response was: %s", response)
             
             # Return empty extraction instead of failing
             return ClinicalDataExtraction(
                 source_document="ai_extraction_failed",
                 overall_confidence=0.0
-            )
\ No newline at end of file
+            )
+    
+    def _parse_items(self, data: Dict[str, Any]) -> ClinicalDataExtraction:
+        """Build an extraction one item at a time, skipping items that don't validate"""
+        # Create extraction object
+        extraction = ClinicalDataExtraction(
+            source_document="ai_extraction"
+        )
+        
+        # Parse lab results - skip invalid ones
+        for lab_data in data.get("lab_results") or []:
+            try:
+                # Skip if missing required fields
+                if not lab_data.get("test_name") or lab_data.get("value") is None:
+                    continue
+                lab_result = LabResult(**lab_data)
+                extraction.lab_results.append(lab_result)
+            except Exception as e:
+                logger.warning("Skipping invalid lab result: %s", e)
+                continue
+        
+        # Parse vital signs - skip invalid ones
+        for vital_data in data.get("vital_signs") or []:
+            try:
+                # Skip if missing required fields
+                if not vital_data.get("parameter") or vital_data.get("value") is None:
+                    continue
+                vital_sign = VitalSign(**vital_data)
+                extraction.vital_signs.append(vital_sign)
+            except Exception as e:
+                logger.warning("Skipping invalid vital sign: %s", e)
+                continue
+        
+        # Parse blood pressure - skip if invalid
+        if data.get("blood_pressure"):
+            try:
+                extraction.blood_pressure = BloodPressure(**data["blood_pressure"])
+            except Exception as e:
+                logger.warning("Skipping invalid blood pressure: %s", e)
+        
+        return extraction
\ No newline at end of file
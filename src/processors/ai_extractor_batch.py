@@ -0,0 +1,115 @@
+import orjson
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from openai import OpenAI
+from models.clinical_data import ClinicalDataExtraction
+from .ai_extractor import AIExtractor, Detail
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+
+class BatchAIExtractor(AIExtractor):
+    """
+    Extracts many documents at once through the OpenAI Batch API
+    
+    Batches cost half as much as individual requests and aren't bound by the
+    per-request rate limit, but results can take up to 24h. Use this for bulk
+    ingests, and AIExtractor when someone is waiting on the answer.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, poll_interval: float = 30.0, model: Optional[str] = None):
+        super().__init__(api_key, model=model)
+        # Batch calls don't go through _call_api, so keep the SDK's built-in retries
+        self.client = OpenAI(api_key=self.api_key)
+        self.poll_interval = poll_interval
+    
+    def extract_clinical_data_batch(self, images: List[Tuple[str, str]],
+                                    detail: Detail = "fit") -> List[ClinicalDataExtraction]:
+        """
+        Extract lab results and vital signs from many images in one batch
+        
+        Args:
+            images: (image_base64, image_format) pairs, as returned by DocumentProcessor
+            detail: Vision detail level, see ai_extractor.Detail
+        
+        Returns:
+            One extraction per image, in the same order; documents the batch
+            couldn't process come back as empty "ai_extraction_failed" extractions
+        """
+        batch_id = self.submit_batch(images, detail)
+        batch = self.wait_for_batch(batch_id)
+        return self.collect_results(batch, len(images))
+    
+    def submit_batch(self, images: List[Tuple[str, str]], detail: Detail = "fit") -> str:
+        """Upload one request per image as a JSONL file and start a batch over it"""
+        # Spool to disk: a batch of full-resolution images easily runs to hundreds of MB
+        with tempfile.TemporaryFile() as requests_file:
+            for index, (image_base64, image_format) in enumerate(images):
+                line = {
+                    "custom_id": str(index),
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": self._build_request(image_base64, image_format, detail)
+                }
+                requests_file.write(orjson.dumps(line))
+                requests_file.write(b"\n")
+            requests_file.seek(0)
+            
+            batch_file = self.client.files.create(file=("batch_requests.jsonl", requests_file), purpose="batch")
+        
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        logger.info("Submitted batch %s with %d documents", batch.id, len(images))
+        return batch.id
+    
+    def wait_for_batch(self, batch_id: str):
+        """Poll until the batch completes; raises RuntimeError if it fails, expires or is cancelled"""
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                return batch
+            if batch.status in BATCH_FAILED_STATUSES:
+                raise RuntimeError(f"Batch {batch_id} ended with status {batch.status}")
+            
+            logger.info("Batch %s is %s, checking again in %ss", batch_id, batch.status, self.poll_interval)
+            time.sleep(self.poll_interval)
+    
+    def collect_results(self, batch, count: int) -> List[ClinicalDataExtraction]:
+        """Parse a completed batch's output file back into extractions, in submission order"""
+        results: List[Optional[ClinicalDataExtraction]] = [None] * count
+        
+        if batch.output_file_id:
+            output = self.client.files.content(batch.output_file_id)
+            for line in output.iter_lines():
+                if not line:
+                    continue
+                result = orjson.loads(line)
+                content = self._response_content(result)
+                if content is not None:
+                    results[int(result["custom_id"])] = self._parse_ai_response(content)
+        
+        failed = results.count(None)
+        if failed:
+            logger.warning("%d of %d documents in batch %s returned no result", failed, count, batch.id)
+        
+        return [
+            result if result is not None
+            else ClinicalDataExtraction(source_document="ai_extraction_failed", overall_confidence=0.0)
+            for result in results
+        ]
+    
+    def _response_content(self, result: Dict[str, Any]) -> Optional[str]:
+        """Return the model's message from one batch output line, or None if that request failed"""
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            logger.warning("Batch request %s failed: %s", result.get("custom_id"), result.get("error") or response.get("body"))
+            return None
+        return response["body"]["choices"][0]["message"]["content"]
\ No newline at end of file
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """
+    Disk cache for LLM responses, one file per key
+    
+    Meant for development runs that extract the same documents over and over;
+    entries older than ttl_days are treated as misses and removed.
+    """
+    
+    def __init__(self, cache_dir: str = ".llm_cache", ttl_days: float = 7):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """SHA-256 over the parts, fed in one at a time so large inputs aren't concatenated"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode())
+            # Separator so ("ab", "c") and ("a", "bc") hash differently
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value, or None if it is missing or expired"""
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_text()
+        except FileNotFoundError:
+            return None
+    
+    def set(self, key: str, value: str):
+        """Store a value; written to a temp file first so readers never see a partial entry"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(value)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            Path(tmp_path).unlink(missing_ok=True)
+            logger.warning("Failed to write LLM cache entry: %s", e)
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
\ No newline at end of file
@@ -5,6 +5,9 @@ Test script to demonstrate EHR to EDC extraction capabilities
 
 import os
 import sys
+import orjson
+import asyncio
+import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -12,12 +15,12 @@ from dotenv import load_dotenv
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from extractors import DocumentProcessor
-from processors import AIExtractor
+from processors import BatchAIExtractor, FIT_DETAIL_MAX_SIZE, get_extractor
 from models import ClinicalDataExtraction
 
 
-def test_extraction(file_path: str):
-    """Test extraction on a sample document"""
+def test_extraction(file_path: str, use_cache: bool = True, all_pages: bool = False):
+    """Test extraction on a sample document; with all_pages, every PDF page is extracted in parallel"""
     
     # Load environment
     load_dotenv()
@@ -29,63 +32,98 @@ def test_extraction(file_path: str):
     
     # Process document
     print(f"Processing document: {file_path}")
-    processor = DocumentProcessor()
+    processor = DocumentProcessor(max_image_size=(FIT_DETAIL_MAX_SIZE, FIT_DETAIL_MAX_SIZE))
     
     try:
+        extractor = get_extractor(cache_dir=".llm_cache" if use_cache else None)
+        output_file = Path("extraction_results.json")
+        
+        if all_pages:
+            pages = processor.process_document_pages(file_path)
+            print(f"✓ Document processed successfully ({len(pages)} pages)")
+            
+            print("Extracting clinical data from all pages...")
+            extractions = extractor.extract_pages(pages)
+            for page_number, extraction in enumerate(extractions, start=1):
+                print(f"\n📄 Page {page_number}")
+                print_extraction(extraction)
+            
+            output_file.write_bytes(orjson.dumps(
+                [extraction.model_dump() for extraction in extractions],
+                option=orjson.OPT_INDENT_2
+            ))
+            print(f"\n✓ Results saved to: {output_file}")
+            return
+        
         image_base64, image_format = processor.process_document(file_path)
         print("✓ Document processed successfully")
         
         # Extract data
         print("Extracting clinical data...")
-        extractor = AIExtractor()
         extraction = extractor.extract_clinical_data(image_base64, image_format)
         
-        # Display results
-        print("\n" + "="*50)
-        print("EXTRACTION RESULTS")
-        print("="*50)
+        print_extraction(extraction)
         
-        print(f"\nOverall Confidence: {extraction.overall_confidence:.2%}")
-        print(f"Confidence Level: {extraction.get_confidence_level().value.upper()}")
+        # Save results
+        output_file.write_bytes(orjson.dumps(extraction.model_dump(), option=orjson.OPT_INDENT_2))
+        print(f"\n✓ Results saved to: {output_file}")
         
-        # Lab Results
-        if extraction.lab_results:
-            print(f"\n📊 Lab Results ({len(extraction.lab_results)} found):")
-            print("-" * 40)
-            for lab in extraction.lab_results:
-                print(f"  {lab.test_name}: {lab.value} {lab.unit}")
-                if lab.reference_range:
-                    print(f"    Reference: {lab.reference_range}")
-                if lab.abnormal_flag:
-                    print(f"    Flag: {lab.abnormal_flag}")
-                print(f"    Confidence: {lab.confidence:.2%}")
-                print()
+    except Exception as e:
+        print(f"\n❌ Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_batch_extraction(file_paths, use_batch_api: bool = False, use_cache: bool = True):
+    """
+    Test extraction on several documents at once
+    
+    Documents are sent as concurrent API calls, or through the OpenAI Batch
+    API (half price, results within 24h) when use_batch_api is set.
+    """
+    
+    # Load environment
+    load_dotenv()
+    
+    # Check API key
+    if not os.getenv("OPENAI_API_KEY"):
+        print("Error: Please set OPENAI_API_KEY in .env file")
+        return
+    
+    processor = DocumentProcessor(max_image_size=(FIT_DETAIL_MAX_SIZE, FIT_DETAIL_MAX_SIZE))
+    
+    try:
+        images = []
+        for file_path in file_paths:
+            print(f"Processing document: {file_path}")
+            images.append(processor.process_document(file_path))
+        print(f"✓ {len(images)} documents processed successfully")
         
-        # Vital Signs
-        if extraction.vital_signs:
-            print(f"\n❤️ Vital Signs ({len(extraction.vital_signs)} found):")
-            print("-" * 40)
-            for vital in extraction.vital_signs:
-                print(f"  {vital.parameter}: {vital.value} {vital.unit}")
-                if vital.position:
-                    print(f"    Position: {vital.position}")
-                print(f"    Confidence: {vital.confidence:.2%}")
-                print()
+        if use_batch_api:
+            # A batch can take anywhere from minutes to 24h
+            print("Submitting batch and waiting for results...")
+            extractor = BatchAIExtractor()
+            results = extractor.extract_clinical_data_batch(images)
+        else:
+            print("Extracting clinical data concurrently...")
+            extractor = get_extractor(cache_dir=".llm_cache" if use_cache else None)
+            results = asyncio.run(extractor.aextract_many(images))
         
-        # Blood Pressure
-        if extraction.blood_pressure:
-            print("\n🩺 Blood Pressure:")
-            print("-" * 40)
-            bp = extraction.blood_pressure
-            print(f"  {bp.systolic}/{bp.diastolic} {bp.unit}")
-            if bp.position:
-                print(f"  Position: {bp.position}")
-            print(f"  Confidence: {bp.confidence:.2%}")
+        extractions = []
+        for file_path, result in zip(file_paths, results):
+            if isinstance(result, Exception):
+                print(f"\n❌ {file_path}: {result}")
+                continue
+            print(f"\n📄 {file_path}")
+            print_extraction(result)
+            extractions.append(result)
         
         # Save results
         output_file = Path("extraction_results.json")
-        with open(output_file, 'w') as f:
-            f.write(extraction.model_dump_json(indent=2))
+        output_file.write_bytes(orjson.dumps(
+            [extraction.model_dump() for extraction in extractions],
+            option=orjson.OPT_INDENT_2
+        ))
         print(f"\n✓ Results saved to: {output_file}")
         
     except Exception as e:
@@ -94,9 +132,74 @@ def test_extraction(file_path: str):
         traceback.print_exc()
 
 
+def print_extraction(extraction: ClinicalDataExtraction):
+    """Print one extraction's results"""
+    print("\n" + "="*50)
+    print("EXTRACTION RESULTS")
+    print("="*50)
+    
+    print(f"\nOverall Confidence: {extraction.overall_confidence:.2%}")
+    print(f"Confidence Level: {extraction.get_confidence_level().value.upper()}")
+    
+    # Lab Results
+    if extraction.lab_results:
+        print(f"\n📊 Lab Results ({len(extraction.lab_results)} found):")
+        print("-" * 40)
+        for lab in extraction.lab_results:
+            print(f"  {lab.test_name}: {lab.value} {lab.unit}")
+            if lab.reference_range:
+                print(f"    Reference: {lab.reference_range}")
+            if lab.abnormal_flag:
+                print(f"    Flag: {lab.abnormal_flag}")
+            print(f"    Confidence: {lab.confidence:.2%}")
+            print()
+    
+    # Vital Signs
+    if extraction.vital_signs:
+        print(f"\n❤️ Vital Signs ({len(extraction.vital_signs)} found):")
+        print("-" * 40)
+        for vital in extraction.vital_signs:
+            print(f"  {vital.parameter}: {vital.value} {vital.unit}")
+            if vital.position:
+                print(f"    Position: {vital.position}")
+            print(f"    Confidence: {vital.confidence:.2%}")
+            print()
+    
+    # Blood Pressure
+    if extraction.blood_pressure:
+        print("\n🩺 Blood Pressure:")
+        print("-" * 40)
+        bp = extraction.blood_pressure
+        print(f"  {bp.systolic}/{bp.diastolic} {bp.unit}")
+        if bp.position:
+            print(f"  Position: {bp.position}")
+        print(f"  Confidence: {bp.confidence:.2%}")
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        test_extraction(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Extract clinical data from medical documents")
+    parser.add_argument("files", nargs="*", help="Path(s) to medical documents")
+    parser.add_argument("--batch", metavar="DIR", help="Extract every supported document in DIR concurrently")
+    parser.add_argument("--all-pages", action="store_true", help="Extract every page of a PDF instead of only the first")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses from .llm_cache/")
+    args = parser.parse_args()
+    
+    load_dotenv()
+    batch_mode = os.getenv("BATCH_MODE", "False").lower() in ("1", "true", "yes")
+    
+    if args.batch:
+        file_paths = sorted(
+            str(path) for path in Path(args.batch).iterdir()
+            if path.suffix.lower() in DocumentProcessor.SUPPORTED_FORMATS
+        )
+        run_batch_extraction(file_paths, use_batch_api=batch_mode, use_cache=not args.no_cache)
+    elif not args.files:
+        print("Usage: python test_extraction.py <path_to_medical_document> [...]")
+        print("       python test_extraction.py --batch <directory>")
+        print("\nExample: python test_extraction.py sample_data/lab_report.pdf")
+        print("Set BATCH_MODE=True to send several documents through the OpenAI Batch API")
+    elif batch_mode:
+        run_batch_extraction(args.files, use_batch_api=True, use_cache=not args.no_cache)
     else:
-        print("Usage: python test_extraction.py <path_to_medical_document>")
-        print("\nExample: python test_extraction.py sample_data/lab_report.pdf")
\ No newline at end of file
+        for file_path in args.files:
+            test_extraction(file_path, use_cache=not args.no_cache, all_pages=args.all_pages)
\ No newline at end of file
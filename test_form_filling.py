@@ -15,7 +15,7 @@ load_dotenv()
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from extractors import DocumentProcessor
-from processors import AIExtractor
+from processors import FIT_DETAIL_MAX_SIZE, get_extractor
 from automation import FormFiller
 from models import ClinicalDataExtraction
 
@@ -28,10 +28,10 @@ def test_form_filling():
     # First, extract data from sample
     print("1. Extracting data from sample lab report...")
     try:
-        processor = DocumentProcessor()
+        processor = DocumentProcessor(max_image_size=(FIT_DETAIL_MAX_SIZE, FIT_DETAIL_MAX_SIZE))
         image_base64, image_format = processor.process_document("sample_data/sample_lab_report.png")
         
-        extractor = AIExtractor()
+        extractor = get_extractor()
         extraction = extractor.extract_clinical_data(image_base64, image_format)
         
         print(f"✅ Extracted {len(extraction.lab_results)} lab results")